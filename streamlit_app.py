@@ -1,9 +1,12 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
+from functools import lru_cache
 import plotly.express as px
+import plotly.graph_objects as go
 import json
 
 # --- Page Configuration ---
@@ -14,7 +17,7 @@ st.set_page_config(
 )
 
 # --- Stylish Headers with Custom CSS ---
-st.markdown("""
+_PAGE_CSS = """
     <style>
         .main-header {
             font-size: 2.5em;
@@ -53,6 +56,16 @@ st.markdown("""
             margin-top: 5px;
         }
     </style>
+"""
+
+@st.cache_resource
+def _inject_css():
+    """Emits the page CSS once; cache replay re-attaches it on reruns
+    without re-hashing or re-sending the block from Python."""
+    st.markdown(_PAGE_CSS, unsafe_allow_html=True)
+
+_inject_css()
+st.markdown("""
     <div class="main-header">🏠 Dashboard Keuangan Keluarga</div>
     <div class="subheader">Catatan Keuangan & Pertumbuhan Aset Bersama</div>
 """, unsafe_allow_html=True)
@@ -61,12 +74,14 @@ st.markdown("""
 # --- Google Sheets Connection (Secure with st.secrets) ---
 
 # Helper function for currency formatting (Indonesian format)
+_THOUSANDS_TBL = str.maketrans({',': '.'})
+
+@lru_cache(maxsize=4096)
 def format_rp(amount):
     """Formats number to Indonesian Rupiah currency string."""
-    try:
-        return f"Rp {amount:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except:
+    if not isinstance(amount, (int, float)) or pd.isna(amount):
         return "Rp 0"
+    return f"Rp {amount:,.0f}".translate(_THOUSANDS_TBL)
 
 @st.cache_resource(ttl=3600)
 def get_google_sheet_client():
@@ -90,18 +105,65 @@ def get_google_sheet_client():
 
 # --- Data Loading and Processing ---
 
-@st.cache_data(ttl=60)
-def load_data(sheet):
-    """Fetches data from Google Sheet and processes it."""
+# The only transaction types the app writes; fixed so the column can be categorical
+TRANSACTION_TYPES = ['Pemasukan', 'Pengeluaran Harian', 'Tabungan Saham', 'Beli Emas']
+
+def _parse_float(value):
+    """Parses a sheet cell to float, treating blanks/garbage as 0 (like fillna(0))."""
     try:
-        data = sheet.get_all_records()
-        df = pd.DataFrame(data)
-    except Exception as e:
-        st.error(f"Gagal mengambil data dari Sheet. Pastikan header baris pertama sudah benar. Error: {e}")
-        return pd.DataFrame()
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _parse_float_column(series):
+    """Parses a string column to float64 in a single vectorized pass.
+
+    Blanks are mapped to 0, then the whole array is converted by NumPy's
+    C-level astype. Only if some cell is genuinely non-numeric do we fall
+    back to the per-element parser, which coerces garbage to 0 as before.
+    """
+    arr = series.to_numpy()
+    try:
+        return np.where(arr == '', '0', arr).astype(np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter((_parse_float(v) for v in arr), dtype=np.float64, count=len(arr))
+
+@st.cache_data(ttl=60)
+def _fetch_values(_sheet, version):
+    """Fetches the raw cell values from the Google Sheet (the only network call).
+
+    The leading underscore tells Streamlit not to hash the gspread object;
+    the result is cached for the TTL instead. `version` is the
+    session-level dirty counter: bumping it on submit invalidates the
+    cache entry without clearing anything else. Returns a 2-D list
+    including the header row — no per-row dict allocation like
+    get_all_records().
+    """
+    return _sheet.get_all_values()
+
+def _fragment(func):
+    """Uses st.fragment when this Streamlit build has it, so decorated
+    sections rerun in isolation instead of re-executing the whole script."""
+    wrapper = getattr(st, 'fragment', None)
+    return wrapper(func) if wrapper else func
+
+_EMPTY_RESULT = (pd.DataFrame(), pd.DataFrame(), pd.Series(dtype=float))
+
+@st.cache_data
+def _process(values):
+    """Builds and cleans the DataFrame from raw sheet rows.
+
+    Returns (df, df_trend, sums): the cleaned data, the date-sorted frame
+    with the cumulative cashflow precomputed, and the per-category sums.
+    Cached on the content of the rows, so all of it only re-runs when the
+    sheet data actually changes.
+    """
+    if not values:
+        return _EMPTY_RESULT
+    df = pd.DataFrame(values[1:], columns=values[0])
 
     if df.empty:
-        return df
+        return _EMPTY_RESULT
 
     # CRITICAL: Verify and standardize column names
     required_cols = ['Tanggal', 'Tipe Transaksi', 'Keterangan', 'Jumlah (Rp)', 'Gram Emas']
@@ -109,35 +171,149 @@ def load_data(sheet):
     for col in required_cols:
         if col not in df.columns:
             st.error(f"Kolom '{col}' tidak ditemukan di Google Sheet. Mohon periksa kembali header kolom (baris 1).")
-            return pd.DataFrame()
+            return _EMPTY_RESULT
 
     # Data Type Conversion and Cleaning
-    df['Tanggal'] = pd.to_datetime(df['Tanggal'], errors='coerce')
-    df['Jumlah (Rp)'] = pd.to_numeric(df['Jumlah (Rp)'], errors='coerce').fillna(0)
-    df['Gram Emas'] = pd.to_numeric(df['Gram Emas'], errors='coerce').fillna(0)
-    
-    # Create calculated columns for easy metric extraction
-    df['Pemasukan'] = df.apply(lambda row: row['Jumlah (Rp)'] if row['Tipe Transaksi'] == 'Pemasukan' else 0, axis=1)
-    df['Pengeluaran'] = df.apply(lambda row: row['Jumlah (Rp)'] if row['Tipe Transaksi'] == 'Pengeluaran Harian' else 0, axis=1)
-    df['Investasi Saham'] = df.apply(lambda row: row['Jumlah (Rp)'] if row['Tipe Transaksi'] == 'Tabungan Saham' else 0, axis=1)
-    df['Beli Emas (Rp)'] = df.apply(lambda row: row['Jumlah (Rp)'] if row['Tipe Transaksi'] == 'Beli Emas' else 0, axis=1)
-    
-    return df
+    # The form always writes %Y-%m-%d, so skip pandas' format inference;
+    # cache=True dedupes repeated dates (several transactions per day)
+    df['Tanggal'] = pd.to_datetime(df['Tanggal'], format='%Y-%m-%d', errors='coerce', cache=True)
+    # int8 codes instead of per-cell string compares for every mask/groupby below
+    df['Tipe Transaksi'] = pd.Categorical(df['Tipe Transaksi'], categories=TRANSACTION_TYPES)
+    # Parse the numeric columns straight into float64 arrays in one pass,
+    # skipping pandas' object-dtype coerce + fillna round trip.
+    df['Jumlah (Rp)'] = _parse_float_column(df['Jumlah (Rp)'])
+    df['Gram Emas'] = _parse_float_column(df['Gram Emas'])
 
-sheet = get_google_sheet_client()
-df = load_data(sheet)
+    # Precompute the derived artifacts so tab switches and reruns hit the cache.
+    # All four per-category totals come from one bincount over the int8
+    # categorical codes — a single sequential scan, no groupby machinery.
+    codes = df['Tipe Transaksi'].cat.codes.to_numpy()
+    valid = codes >= 0  # rows whose type isn't one of the known categories
+    # Name the Series and its index like the groupby result it replaced,
+    # so reset_index() downstream yields the Tipe Transaksi / Jumlah (Rp) columns
+    sums = pd.Series(
+        np.bincount(codes[valid], weights=df['Jumlah (Rp)'].to_numpy()[valid], minlength=len(TRANSACTION_TYPES)),
+        index=pd.Index(TRANSACTION_TYPES, name='Tipe Transaksi'),
+        name='Jumlah (Rp)',
+    )
 
+    df_trend = df.dropna(subset=['Tanggal']).sort_values('Tanggal')
+    cashflow = (
+        df_trend['Jumlah (Rp)'].where(df_trend['Tipe Transaksi'].eq('Pemasukan'), 0)
+        - df_trend['Jumlah (Rp)'].where(df_trend['Tipe Transaksi'].eq('Pengeluaran Harian'), 0)
+    )
+    df_trend['Kekayaan Kumulatif'] = cashflow.cumsum()
 
-# --- Core Metrics Calculation ---
-if not df.empty:
-    total_pemasukan = df['Pemasukan'].sum()
-    total_pengeluaran = df['Pengeluaran'].sum()
-    total_tabungan_saham = df['Investasi Saham'].sum()
+    return df, df_trend, sums
+
+@st.cache_data
+def _compute_metrics(df, sums):
+    """Derives the headline KPI totals from the cached aggregates in one go."""
+    total_pemasukan = sums.get('Pemasukan', 0)
+    total_pengeluaran = sums.get('Pengeluaran Harian', 0)
+    total_tabungan_saham = sums.get('Tabungan Saham', 0)
     total_gram_emas = df['Gram Emas'].sum()
-    
     saldo_cashflow = total_pemasukan - total_pengeluaran
-    
-    total_kekayaan = saldo_cashflow + total_tabungan_saham + (total_gram_emas * 900000) # Assuming Rp900k/gram for quick estimate
+    return {
+        'saldo_cashflow': saldo_cashflow,
+        'total_tabungan_saham': total_tabungan_saham,
+        'total_gram_emas': total_gram_emas,
+        'total_kekayaan': saldo_cashflow + total_tabungan_saham + (total_gram_emas * 900000), # Assuming Rp900k/gram for quick estimate
+    }
+
+@st.cache_data
+def _prepare_history(df):
+    """Returns the date-sorted transaction history for display.
+
+    Cached on the processed df, so the sort only re-runs when the
+    underlying data changes — not on every widget rerun. Numeric columns
+    stay numeric; formatting is applied client-side via column_config.
+    """
+    return df.sort_values('Tanggal', ascending=False)[['Tanggal', 'Tipe Transaksi', 'Keterangan', 'Jumlah (Rp)', 'Gram Emas']]
+
+@_fragment
+def _render_dashboard(df, df_trend, sums):
+    """Renders the chart and history tabs.
+
+    As a fragment (where supported), tab interactions rerun only this
+    section instead of the whole script.
+    """
+    tab1, tab2 = st.tabs(["Visualisasi & Analisis", "Histori Transaksi Detail"])
+
+    with tab1:
+        st.subheader("📈 Analisis Pergerakan Keuangan")
+
+        # 1. Pie Chart: Uang Mengalir Kemana? (Pengeluaran vs Tabungan)
+
+        # Reuse the per-category sums computed for the KPIs (groupby runs once);
+        # filter the tiny aggregate on its index before touching a DataFrame.
+        flow_df = sums[sums.index.isin(['Pengeluaran Harian', 'Tabungan Saham', 'Beli Emas'])].reset_index()
+
+        if not flow_df.empty and flow_df['Jumlah (Rp)'].sum() > 0:
+            fig1 = px.pie(
+                flow_df,
+                values='Jumlah (Rp)',
+                names='Tipe Transaksi',
+                title='Alokasi Uang (Pengeluaran vs Tabungan)',
+                color_discrete_sequence=px.colors.sequential.Agsunset,
+                hole=.3 # Donut chart style
+            )
+            fig1.update_traces(textposition='inside', textinfo='percent+label')
+            st.plotly_chart(fig1, use_container_width=True)
+        else:
+            st.info("Belum ada Pengeluaran atau Tabungan yang tercatat untuk dianalisis.")
+
+        # 2. Line Chart: Tren Saldo Bersih Kumulatif (precomputed in _process)
+        try:
+            # Scattergl renders via WebGL instead of SVG, so the line stays
+            # responsive as the transaction history grows. Deliberately
+            # linear: the old SVG spline made the browser re-interpolate
+            # the whole path on every pan/zoom for purely cosmetic effect.
+            fig2 = go.Figure(go.Scattergl(
+                x=df_trend['Tanggal'],
+                y=df_trend['Kekayaan Kumulatif'],
+                mode='lines+markers',
+                line=dict(color='#008080')
+            ))
+            fig2.update_layout(title='Tren Saldo Bersih (Cashflow) dari Waktu ke Waktu')
+            st.plotly_chart(fig2, use_container_width=True)
+        except Exception as e:
+            st.info("Tidak cukup data (atau format tanggal bermasalah) untuk membuat grafik tren kumulatif.")
+
+
+    with tab2:
+        st.subheader("📃 Riwayat Transaksi Lengkap")
+        # Displaying the clean data frame
+        st.dataframe(
+            _prepare_history(df),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                'Tanggal': st.column_config.DateColumn(format='YYYY-MM-DD'),
+                'Jumlah (Rp)': st.column_config.NumberColumn(format='Rp %d'),
+                'Gram Emas': st.column_config.NumberColumn(format='%.2f gr'),
+            },
+        )
+
+def load_data(sheet):
+    """Fetches data from Google Sheet and processes it."""
+    try:
+        values = _fetch_values(sheet, st.session_state['data_version'])
+    except Exception as e:
+        st.error(f"Gagal mengambil data dari Sheet. Pastikan header baris pertama sudah benar. Error: {e}")
+        return _EMPTY_RESULT
+    return _process(values)
+
+sheet = get_google_sheet_client()
+st.session_state.setdefault('data_version', 0)
+df, df_trend, sums = load_data(sheet)
+
+
+# --- Core Metrics, Visualization and History ---
+# A single data-dependent block: KPIs, charts and history all read from the
+# aggregates computed once in the cached helpers.
+if not df.empty:
+    metrics = _compute_metrics(df, sums)
 
     # --- Display Metrics (Key Performance Indicators) ---
     st.subheader("📊 Ringkasan Kekayaan dan Saldo")
@@ -147,7 +323,7 @@ if not df.empty:
         st.markdown(f"""
             <div class='metric-box' style='background-color: #e6f7ff; border-left: 5px solid #4A90E2;'>
                 <div class='metric-title'>Total Kekayaan (Est.)</div>
-                <div class='metric-value' style='color: #4A90E2;'>{format_rp(total_kekayaan)}</div>
+                <div class='metric-value' style='color: #4A90E2;'>{format_rp(metrics['total_kekayaan'])}</div>
             </div>
         """, unsafe_allow_html=True)
 
@@ -155,7 +331,7 @@ if not df.empty:
         st.markdown(f"""
             <div class='metric-box' style='background-color: #e6ffe6; border-left: 5px solid #2ECC71;'>
                 <div class='metric-title'>Saldo Bersih (Pemasukan - Pengeluaran)</div>
-                <div class='metric-value' style='color: #2ECC71;'>{format_rp(saldo_cashflow)}</div>
+                <div class='metric-value' style='color: #2ECC71;'>{format_rp(metrics['saldo_cashflow'])}</div>
             </div>
         """, unsafe_allow_html=True)
         
@@ -163,7 +339,7 @@ if not df.empty:
         st.markdown(f"""
             <div class='metric-box' style='background-color: #fffae6; border-left: 5px solid #F1C40F;'>
                 <div class='metric-title'>Total Tabungan Saham</div>
-                <div class='metric-value' style='color: #F1C40F;'>{format_rp(total_tabungan_saham)}</div>
+                <div class='metric-value' style='color: #F1C40F;'>{format_rp(metrics['total_tabungan_saham'])}</div>
             </div>
         """, unsafe_allow_html=True)
 
@@ -171,11 +347,19 @@ if not df.empty:
         st.markdown(f"""
             <div class='metric-box' style='background-color: #ffe6e6; border-left: 5px solid #E74C3C;'>
                 <div class='metric-title'>Total Tabungan Emas (Gram)</div>
-                <div class='metric-value' style='color: #E74C3C;'>{total_gram_emas:,.2f} Gram</div>
+                <div class='metric-value' style='color: #E74C3C;'>{metrics['total_gram_emas']:,.2f} Gram</div>
             </div>
         """, unsafe_allow_html=True)
 
 
+    # --- Data Visualization and History ---
+    st.markdown("---")
+    _render_dashboard(df, df_trend, sums)
+
+else:
+    st.markdown("---")
+    st.warning("Belum ada data yang berhasil dimuat dari Google Sheets. Silakan masukkan transaksi pertama Anda di bawah, atau cek kembali koneksi Google Sheets.")
+
 # --- Form Input Data Baru ---
 st.markdown("---")
 st.subheader("✍️ Catat Transaksi Keuangan")
@@ -184,102 +368,58 @@ st.caption("Gunakan bagian ini untuk memasukkan data Pemasukan, Pengeluaran, Tab
 with st.form("input_form"):
     cols_input = st.columns([1, 1, 1.5])
     tanggal = cols_input[0].date_input("Tanggal Transaksi", value=datetime.today())
-    
+
     transaction_type = cols_input[1].selectbox(
-        "Pilih Tipe Transaksi", 
-        ["Pemasukan", "Pengeluaran Harian", "Tabungan Saham", "Beli Emas"]
+        "Pilih Tipe Transaksi",
+        TRANSACTION_TYPES
     )
-    
+
     jumlah_rp = cols_input[2].number_input("Jumlah Uang (Rp)", min_value=0, value=0, step=1000)
-    
+
     gram_emas = 0
     if transaction_type == "Beli Emas":
         gram_emas = st.number_input("Jumlah Gram Emas yang Dibeli", min_value=0.00, value=0.00, step=0.01)
 
     keterangan = st.text_input("Keterangan (Contoh: Gaji Istri, Bayar Listrik, Beli Saham BBCA, Beli Emas 1gr)")
-    
+
     submit = st.form_submit_button("Simpan Transaksi ke Google Sheet")
 
 if submit:
     if jumlah_rp == 0 and gram_emas == 0:
         st.warning("Anda harus memasukkan Jumlah Uang (Rp) atau Gram Emas.")
     else:
+        # Queue the row locally, then flush the whole queue in one API call.
+        # If a previous flush failed, those rows are still here and go out
+        # together with this one — N submissions cost one round-trip, not N.
+        pending = st.session_state.setdefault('pending_rows', [])
+        row_data = [
+            tanggal.strftime("%Y-%m-%d"),
+            transaction_type,
+            keterangan,
+            jumlah_rp,
+            gram_emas
+        ]
+        # A resubmit after a failed flush carries the same form values;
+        # don't queue a second copy of a row that is already pending.
+        if row_data not in pending:
+            pending.append(row_data)
         try:
-            # Data to be appended to Google Sheets
-            row_data = [
-                tanggal.strftime("%Y-%m-%d"),
-                transaction_type,
-                keterangan,
-                jumlah_rp,
-                gram_emas
-            ]
-            
-            sheet.append_row(row_data)
-            
-            st.success(f"✅ Transaksi '{transaction_type}' sebesar {format_rp(jumlah_rp)} berhasil disimpan!")
-            # Clear cache and rerun to update dashboard immediately
-            load_data.clear()
-            st.experimental_rerun()
-            
-        except Exception as e:
-            st.error(f"Terjadi kesalahan saat menyimpan data: {e}")
-
-# --- Data Visualization and History ---
-if not df.empty:
-    st.markdown("---")
-    tab1, tab2 = st.tabs(["Visualisasi & Analisis", "Histori Transaksi Detail"])
-
-    with tab1:
-        st.subheader("📈 Analisis Pergerakan Keuangan")
-        
-        # 1. Pie Chart: Uang Mengalir Kemana? (Pengeluaran vs Tabungan)
-        
-        # Group and prepare data for the Pie Chart
-        flow_df = df.groupby('Tipe Transaksi')['Jumlah (Rp)'].sum().reset_index()
-        flow_df = flow_df[flow_df['Tipe Transaksi'].isin(['Pengeluaran Harian', 'Tabungan Saham', 'Beli Emas'])]
-        
-        if not flow_df.empty and flow_df['Jumlah (Rp)'].sum() > 0:
-            fig1 = px.pie(
-                flow_df,
-                values='Jumlah (Rp)',
-                names='Tipe Transaksi',
-                title='Alokasi Uang (Pengeluaran vs Tabungan)',
-                color_discrete_sequence=px.colors.sequential.Agsunset,
-                hole=.3 # Donut chart style
-            )
-            fig1.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(fig1, use_container_width=True)
-        else:
-            st.info("Belum ada Pengeluaran atau Tabungan yang tercatat untuk dianalisis.")
-
-        # 2. Line Chart: Tren Saldo Bersih Kumulatif
-        try:
-            df_trend = df.sort_values('Tanggal')
-            df_trend['Cashflow Harian'] = df_trend['Pemasukan'] - df_trend['Pengeluaran']
-            df_trend['Kekayaan Kumulatif'] = df_trend['Cashflow Harian'].cumsum()
-
-            fig2 = px.line(
-                df_trend.dropna(subset=['Tanggal']), # Drop rows where Tanggal is NaT
-                x='Tanggal', 
-                y='Kekayaan Kumulatif', 
-                title='Tren Saldo Bersih (Cashflow) dari Waktu ke Waktu',
-                markers=True,
-                line_shape='spline' # Smoother line
+            # Hit the Sheets v4 values.append endpoint directly — unlike
+            # append_row(s) this skips gspread's client-side range probing,
+            # and RAW skips server-side value re-interpretation.
+            sheet.spreadsheet.values_append(
+                f"'{sheet.title}'!A:E",
+                params={'valueInputOption': 'RAW'},
+                body={'values': pending},
             )
-            fig2.update_traces(line_color='#008080')
-            st.plotly_chart(fig2, use_container_width=True)
-        except Exception as e:
-            st.info("Tidak cukup data (atau format tanggal bermasalah) untuk membuat grafik tren kumulatif.")
+            st.session_state['pending_rows'] = []
 
+            st.success(f"✅ Transaksi '{transaction_type}' sebesar {format_rp(jumlah_rp)} berhasil disimpan!")
+            # Bump the dirty counter so only the fetch cache entry for the
+            # old version goes stale, then rerun to update the dashboard
+            # (st.rerun on current builds, experimental_rerun on older ones)
+            st.session_state['data_version'] += 1
+            (getattr(st, 'rerun', None) or st.experimental_rerun)()
 
-    with tab2:
-        st.subheader("📃 Riwayat Transaksi Lengkap")
-        # Displaying the clean data frame
-        display_df = df.sort_values('Tanggal', ascending=False)[['Tanggal', 'Tipe Transaksi', 'Keterangan', 'Jumlah (Rp)', 'Gram Emas']]
-        display_df['Jumlah (Rp)'] = display_df['Jumlah (Rp)'].apply(format_rp)
-        display_df['Gram Emas'] = display_df['Gram Emas'].apply(lambda x: f"{x:,.2f}" if x > 0 else "")
-        st.dataframe(display_df, use_container_width=True, hide_index=True)
-            
-else:
-    st.markdown("---")
-    st.warning("Belum ada data yang berhasil dimuat dari Google Sheets. Silakan masukkan transaksi pertama Anda di atas, atau cek kembali koneksi Google Sheets.")
+        except Exception as e:
+            st.error(f"Terjadi kesalahan saat menyimpan data (transaksi diantrekan dan akan dikirim ulang): {e}")